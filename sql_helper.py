@@ -35,15 +35,30 @@ Example::
 
 __author__ = "Steve Campbell"
 
+import functools
 import logging
 import re
 import sqlite3
 import time
 from abc import ABC, abstractmethod
-from typing import List, Optional, Tuple, Sequence
+from contextlib import contextmanager, nullcontext
+from operator import itemgetter
+from typing import Iterator, List, Optional, Tuple, Sequence
 
 from dbapi2abc import Connection, Cursor
 
+_log = logging.getLogger(__name__)
+
+_UNIX_TS_RE = re.compile(r"unix_timestamp\(\)", re.IGNORECASE)
+# A SELECT we can safely append LIMIT to - not already limited, and without
+# trailing clauses which must follow LIMIT.
+_SELECT_NO_LIMIT_RE = re.compile(
+    r"^\s*select\b(?![\s\S]*\b(?:limit|offset|into|for\s+update|for\s+share|lock\s+in\s+share\s+mode)\b)",
+    re.IGNORECASE
+)
+# "?,?,...", indexed by the number of placeholders
+_PLACEHOLDERS = [",".join(["?"] * i) for i in range(128)]
+
 
 class SqlHelper(ABC):
 
@@ -63,6 +78,10 @@ class SqlHelper(ABC):
         self._con = con
         self._last_sql = None
         self._last_bind = None
+        # SQL built by insert/update, keyed on the table and field names
+        self._insert_sql_cache = {}
+        self._update_sql_cache = {}
+        self._in_transaction = False
 
     @property
     def con(self) -> Connection:
@@ -99,11 +118,68 @@ class SqlHelper(ABC):
         self._last_sql = sql
         self._last_bind = bind or []
 
+    def executemany(self, sql: str, binds: Sequence[Sequence]) -> Cursor:
+        """ Execute a statement for each set of bind parameters.
+        This default just calls execute() for each; subclasses override it
+        to prepare the statement once with the driver's executemany().
+        :param sql: The SQL statement to execute.
+        :param binds: Sequence of bind parameter lists, one per execution.
+        :return: The cursor.
+        """
+        cur = None
+        for bind in binds:
+            cur = self.execute(sql, bind)
+        self._last_sql = sql
+        self._last_bind = binds[0] if binds else []
+        return cur if cur is not None else self.con.cursor()
+
     def last_sql(self) -> str:
         """ :return: A string of the last SQl and bind parameters for logging
          or debugging.
          """
-        return "SQL: %s, Bind: (%s)" % (self._last_sql, ", ".join(map(str, self._last_bind)))
+        return str(self.lazy_last_sql())
+
+    def lazy_last_sql(self) -> "LazySql":
+        """ :return: The last SQL and bind parameters, only formatted as
+         a string when needed - e.g. when passed as a logging argument and
+         the record isn't dropped.
+         """
+        return LazySql(self._last_sql, self._last_bind)
+
+    @contextmanager
+    def transaction(self) -> Iterator[None]:
+        """ Context manager to run a block in a single transaction. This is
+        much faster than committing each statement when making many changes.
+        The transaction is committed at the end of the block, or rolled back
+        if it raises. Nested calls, and calls inside a transaction the
+        caller began with BEGIN, join the outer transaction and leave
+        committing to it.
+
+        Example::
+
+            with db.transaction():
+                for row in rows:
+                    db.insert("TestTab", row)
+
+        :return: None
+        """
+        # Join a transaction we, or the caller, already began. Only some
+        # drivers, e.g. sqlite3, tell us about the latter.
+        if self._in_transaction or getattr(self.con, "in_transaction", False):
+            yield
+            return
+
+        self.execute("BEGIN")
+        self._in_transaction = True
+        try:
+            yield
+        except BaseException:
+            self.con.rollback()
+            raise
+        else:
+            self.con.commit()
+        finally:
+            self._in_transaction = False
 
     def row(self, sql: str, bind: Optional[Sequence] = None) -> Optional[dict]:
         """ Execute some SQL and return the row as a dict.
@@ -133,6 +209,11 @@ class SqlHelper(ABC):
 
     def _row(self, sql: str, bind: Optional[Sequence] = None, fetch_dicts: bool = False):
 
+        # We only need a second row to know there are too many, so don't
+        # let the database find any more.
+        if _SELECT_NO_LIMIT_RE.match(sql):
+            sql = sql.rstrip().rstrip(";") + " LIMIT 2"
+
         cur = self.execute(sql, bind, fetch_dicts=fetch_dicts)
         row = cur.fetchone()
         row2 = cur.fetchone()
@@ -164,8 +245,7 @@ class SqlHelper(ABC):
         :param sql: The SQL statement to execute.
         :param bind: List of parameters to be bound into the statement.
         """
-        cur = self.execute(sql, bind, fetch_dicts=True)
-        return tuple(cur.fetchall())
+        return tuple(self.rows_iter(sql, bind))
 
     # noinspection PyTypeChecker
     def t_rows(self, sql: str, bind: Optional[list] = None) -> Tuple[tuple]:
@@ -176,8 +256,35 @@ class SqlHelper(ABC):
         :param sql: The SQL statement to execute.
         :param bind: List of parameters to be bound into the statement.
         """
+        return tuple(self.t_rows_iter(sql, bind))
+
+    def rows_iter(self, sql: str, bind: Optional[list] = None, size: int = 1000) -> Iterator[dict]:
+        """ Execute SQL and yield each row as a dict, fetching from the
+        cursor in batches to bound memory on large result sets.
+
+        See also: meth:`sql_helper.SqlHelper.rows`
+
+        :param sql: The SQL statement to execute.
+        :param bind: List of parameters to be bound into the statement.
+        :param size: Number of rows to fetch per batch.
+        :return: Iterator over the rows.
+        """
+        cur = self.execute(sql, bind, fetch_dicts=True)
+        return _fetch_batches(cur, size)
+
+    def t_rows_iter(self, sql: str, bind: Optional[list] = None, size: int = 1000) -> Iterator[tuple]:
+        """ Execute SQL and yield each row as a tuple, fetching from the
+        cursor in batches to bound memory on large result sets.
+
+        See also: meth:`sql_helper.SqlHelper.t_rows`
+
+        :param sql: The SQL statement to execute.
+        :param bind: List of parameters to be bound into the statement.
+        :param size: Number of rows to fetch per batch.
+        :return: Iterator over the rows.
+        """
         cur = self.execute(sql, bind, fetch_dicts=False)
-        return tuple(cur.fetchall())
+        return _fetch_batches(cur, size)
 
     def column(self, sql: str, bind: Optional[list] = None) -> List:
         """ Execute SQL and return a list of the first field
@@ -187,14 +294,20 @@ class SqlHelper(ABC):
         :return: List of the first field in each row.
         """
         cur = self.execute(sql, bind, fetch_dicts=False)
-        column = []
-        while True:
-            row = cur.fetchone()
-            if not row:
-                break
-            column.append(row[0])
+        return list(map(itemgetter(0), cur.fetchall()))
+
+    def column_iter(self, sql: str, bind: Optional[list] = None, size: int = 1000) -> Iterator:
+        """ Execute SQL and yield the first field in each row, fetching
+        from the cursor in batches to bound memory on large result sets.
+
+        See also: meth:`sql_helper.SqlHelper.column`
 
-        return column
+        :param sql: The SQL statement to execute.
+        :param bind: List of parameters to be bound into the statement.
+        :param size: Number of rows to fetch per batch.
+        :return: Iterator over the first field in each row.
+        """
+        return map(itemgetter(0), self.t_rows_iter(sql, bind, size))
 
     def insert(self, table: str, attributes: dict) -> None:
         """ Insert a row of data into a table.
@@ -202,11 +315,34 @@ class SqlHelper(ABC):
         :param table: The table to insert the row into.
         :param attributes: Dict of Field: Value for the row.
         """
-        fields = "`" + "`,`".join(attributes.keys()) + "`"
-        placeholder_list = "?" * len(attributes)
-        placeholders = ",".join(placeholder_list)
-        sql = f"INSERT INTO {table}({fields}) VALUES({placeholders})"
-        self.execute(sql, bind=list(attributes.values()))
+        self.insert_many(table, [attributes])
+
+    def insert_many(self, table: str, rows: Sequence[dict]) -> None:
+        """ Insert several rows of data into a table with a single
+        prepared statement.
+
+        The fields are taken from the first row; every row must have
+        the same fields.
+
+        :param table: The table to insert the rows into.
+        :param rows: Sequence of dicts of Field: Value, one per row.
+        :raises KeyError: If a row is missing a field from the first row.
+        """
+        # Nothing to insert? Just return
+        if len(rows) == 0:
+            return
+
+        cache_key = (table, tuple(rows[0]))
+        cached = self._insert_sql_cache.get(cache_key)
+        if cached is None:
+            keys = sorted(rows[0].keys())
+            fields = "`" + "`,`".join(keys) + "`"
+            placeholders = _placeholders(len(keys))
+            sql = f"INSERT INTO {table}({fields}) VALUES({placeholders})"
+            cached = self._insert_sql_cache[cache_key] = (keys, sql)
+
+        keys, sql = cached
+        self.executemany(sql, [[row[k] for k in keys] for row in rows])
 
     def update(self, table: str, attributes: dict, filters: dict) -> None:
         """ Update a table.
@@ -215,7 +351,8 @@ class SqlHelper(ABC):
         :param attributes: Fields to be updated -
             {Field1: value1, field2: value2, ...}.
         :param filters: Dict of {Field: Value} to filter the rows which are
-            updated. Filters must be specified, but can be empty.
+            updated. Filters must be specified, but can be empty. A list or
+            tuple value matches any of its values, with `Field` IN (...).
         :return: None. We would return the rowcount, but SQLite returns a
             different rowcount to other database engines.
         """
@@ -224,27 +361,133 @@ class SqlHelper(ABC):
         if len(attributes) == 0:
             return
 
-        set_str = "SET `" + "`=?, `".join(attributes.keys()) + "`=?"
         bind_values = list(attributes.values())
+        filter_shape = []
+        for field, value in filters.items():
+            if isinstance(value, (list, tuple)):
+                filter_shape.append((field, len(value)))
+                bind_values.extend(value)
+            else:
+                filter_shape.append((field, None))
+                bind_values.append(value)
+
+        # The SQL for IN lists depends on their lengths, which would give
+        # an unbounded number of cache entries, so only cache without them
+        cacheable = all(count is None for _, count in filter_shape)
+        cache_key = (table, tuple(attributes), tuple(filters))
+        sql = self._update_sql_cache.get(cache_key) if cacheable else None
+        if sql is None:
+            set_str = "SET `" + "`=?, `".join(attributes.keys()) + "`=?"
+            conditions = []
+            for field, count in filter_shape:
+                if count is None:
+                    conditions.append(f"`{field}`=?")
+                elif count == 0:
+                    # Nothing can match an empty list
+                    conditions.append("1=0")
+                else:
+                    conditions.append(f"`{field}` IN ({_placeholders(count)})")
+            where_str = ""
+            if len(conditions) > 0:
+                where_str = " WHERE " + " AND ".join(conditions)
+            sql = f"UPDATE `{table}` {set_str}{where_str}"
+            if cacheable:
+                self._update_sql_cache[cache_key] = sql
 
-        where_str = ""
-        if len(filters) > 0:
-            where_str = " WHERE `" + "`=? AND `".join(filters.keys()) + "`=?"
-            bind_values = bind_values + list(filters.values())
-
-        sql = f"UPDATE `{table}` {set_str}{where_str}"
         self.execute(sql, bind=bind_values)
 
 
+class LazySql:
+    """ SQL and bind parameters, formatted for logging on demand """
+
+    __slots__ = ("sql", "bind")
+
+    def __init__(self, sql: Optional[str], bind: Optional[Sequence]):
+        self.sql = sql
+        self.bind = bind
+
+    def __str__(self) -> str:
+        return "SQL: %s, Bind: (%s)" % (self.sql, ", ".join(map(str, self.bind)))
+
+
+def _placeholders(count: int) -> str:
+    """ :return: A comma separated list of count ? placeholders """
+    if count < len(_PLACEHOLDERS):
+        return _PLACEHOLDERS[count]
+    return ",".join(["?"] * count)
+
+
+def _fetch_batches(cur: Cursor, size: int) -> Iterator:
+    """ Yield every row from the cursor, fetching size rows at a time """
+    while True:
+        batch = cur.fetchmany(size)
+        if not batch:
+            return
+        yield from batch
+
+
+def sqlite_dict_factory(cursor, row):
+    """ See `SQLite Docs
+    <https://docs.python.org/3/library/sqlite3.html>`_
+    """
+    d = {}
+    for idx, col in enumerate(cursor.description):
+        d[col[0]] = row[idx]
+    return d
+
+
+try:
+    # Compiled version, if sql_helper_fast.pyx has been built
+    from sql_helper_fast import dict_factory as sqlite_dict_factory
+except ImportError:
+    pass
+
+
 class SqliteHelper(SqlHelper):
-    """ Extend the SqlHelper class for SQLite databases """
+    """ Extend the SqlHelper class for SQLite databases
+
+    Connections are in autocommit mode, so each statement is committed as
+    it runs. Use :py:meth:`.SqlHelper.transaction` to group statements.
+
+    Rows fetched with fetch_dicts are built by dict_row_factory. Set it to
+    sqlite3.Row, on the class or an instance, to have the C implemented
+    Row objects returned instead - these are addressable by index and by
+    name, and dict(row) gives a real dict, but they do not compare equal
+    to dicts.
+    """
+
+    dict_row_factory = staticmethod(sqlite_dict_factory)
+
+    def __init__(self, url: Optional[str] = None, con: Optional[Connection] = None,
+                 tune: bool = True):
+        """ Initialize.
+
+        See :py:meth:`.SqlHelper.__init__`
+
+        :param url: Database URL.
+        :param con: Database connection handle.
+        :param tune: If true, connect() sets pragmas for write throughput -
+            WAL journalling with synchronous=NORMAL (a power loss can lose
+            the last commits, but won't corrupt the database), in memory
+            temp tables and a 64MB page cache.
+        :return: None
+        """
+        super().__init__(url=url, con=con)
+        self.tune = tune
 
     def connect(self) -> Connection:
         """ Connect to the sqlite3 database specified in the url attribute """
         # Normal URL parsing won't cope with :memory:
-        database = re.sub(r"sqlite\d?://", "", self.url)
-        database = re.sub(r"/.*", "", database)
-        con = sqlite3.connect(database)
+        tail = self.url.split("://", 1)[-1]
+        database = tail.split("/", 1)[0]
+        # Autocommit; transactions are only started by transaction()
+        con = sqlite3.connect(database, isolation_level=None)
+        if self.tune:
+            pragmas = "PRAGMA temp_store=MEMORY; PRAGMA cache_size=-64000;"
+            # WAL needs a file; in memory databases can't use it
+            if database not in ("", ":memory:"):
+                pragmas = "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; " + pragmas
+            con.executescript(pragmas)
         return con
 
     def execute(self, sql: str, bind: Optional[list] = None, fetch_dicts: bool = False) -> Cursor:
@@ -258,37 +501,63 @@ class SqliteHelper(SqlHelper):
         :return: The cursor.
         """
         bind = bind or []
-        super().execute(sql, bind)
-        saved_row_factory = self.con.row_factory
+        # Inlined SqlHelper.execute, saving a call per statement
+        self._last_sql = sql
+        self._last_bind = bind
+        cur = self.con.cursor()
         if fetch_dicts:
-            self.con.row_factory = sqlite_dict_factory
+            # Set on the cursor so the connection's row_factory is untouched
+            cur.row_factory = self.dict_row_factory
 
-        cur = self.con.cursor()
-        sql = self.sql_to_sqlite3(sql)
-        logging.info("Executing %s", self.last_sql())
+        sql = sqlite_unix_timestamp(self.sql_to_sqlite3(sql))
+        if _log.isEnabledFor(logging.INFO):
+            _log.info("Executing %s", self.lazy_last_sql())
         cur.execute(sql, bind)
-        self.con.row_factory = saved_row_factory
 
         return cur
 
-    def sql_to_sqlite3(self, sql: str) -> str:
+    def executemany(self, sql: str, binds: Sequence[Sequence]) -> Cursor:
+        """ Prepare a statement once and execute it for each set of bind
+        parameters.
+
+        See :py:meth:`.SqlHelper.executemany`
+
+        :param sql: The SQL statement to execute.
+        :param binds: Sequence of bind parameter lists, one per execution.
+        :return: The cursor.
+        """
+        # In autocommit mode each execution would be its own transaction;
+        # a single execution is atomic anyway, so doesn't need one
+        with self.transaction() if len(binds) > 1 else nullcontext():
+            self._last_sql = sql
+            self._last_bind = binds[0] if binds else []
+            cur = self.con.cursor()
+            sql = sqlite_unix_timestamp(self.sql_to_sqlite3(sql))
+            if _log.isEnabledFor(logging.INFO):
+                _log.info("Executing %s x%d", self.lazy_last_sql(), len(binds))
+            cur.executemany(sql, binds)
+
+        return cur
+
+    @staticmethod
+    @functools.lru_cache(maxsize=2048)
+    def sql_to_sqlite3(sql: str) -> str:
         """ Make a few conversions from other formats to SQLite format.
         This is not intended to handle everything, just a few common cases.
         We currently handle:
           %s to ?
-          unix_timestamp()
+
+        Results are cached per distinct SQL string. unix_timestamp() depends
+        on the current time, so is handled by :func:`sqlite_unix_timestamp`.
         """
-        unix_time = int(time.time())
-        sql = re.sub("%s", "?", sql)
-        sql = re.sub(r"unix_timestamp\(\)", str(unix_time), sql, flags=re.IGNORECASE)
+        sql = sql.replace("%s", "?")
         return sql
 
 
-def sqlite_dict_factory(cursor, row):
-    """ See `SQLite Docs
-    <https://docs.python.org/3/library/sqlite3.html>`_
+def sqlite_unix_timestamp(sql: str) -> str:
+    """ Replace unix_timestamp() with the current unix time, as SQLite has
+    no equivalent function.
     """
-    d = {}
-    for idx, col in enumerate(cursor.description):
-        d[col[0]] = row[idx]
-    return d
+    if "unix_timestamp" in sql.lower():
+        sql = _UNIX_TS_RE.sub(str(int(time.time())), sql)
+    return sql
@@ -0,0 +1,179 @@
+#!/usr/bin/python
+#
+# Copyright (C) 2021 Steve Campbell
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Wrap a SqlHelper for use from asyncio code.
+
+Every call is run on a single worker thread dedicated to the wrapped
+helper, so the event loop isn't blocked, and the connection is only ever
+used from one thread - as SQLite requires.
+
+Example::
+
+    from sql_helper import SqliteHelper
+    from sql_helper_async import AsyncSqlHelper
+
+    async with AsyncSqlHelper(SqliteHelper(url="sqlite://test.db")) as db:
+        await db.insert("TestTab", {"Id": 1, "Col1": "a", "Col2": "b"})
+        for row in await db.rows("SELECT * FROM TestTab"):
+            print("Found col1 %s" % row["Col1"])
+
+"""
+
+__author__ = "Steve Campbell"
+
+import asyncio
+import queue
+import threading
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+from sql_helper import SqlHelper
+
+
+class AsyncSqlHelper:
+    """ Run the methods of a SqlHelper on a dedicated worker thread """
+
+    def __init__(self, helper: SqlHelper):
+        """ Initialize, and start the worker thread.
+
+        :param helper: The SqlHelper to wrap. It should not be used directly
+            once wrapped.
+        :return: None
+        """
+        self._sync = helper
+        self._calls = queue.Queue()
+        self._closed = False
+        self._thread = threading.Thread(target=self._worker, name="AsyncSqlHelper", daemon=True)
+        self._thread.start()
+
+    async def __aenter__(self) -> "AsyncSqlHelper":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def _worker(self) -> None:
+        """ Run queued calls until we get the None sentinel """
+        while True:
+            item = self._calls.get()
+            if item is None:
+                return
+            loop, future, func = item
+            try:
+                result = func()
+            except BaseException as e:
+                callback, arg = _set_exception, e
+            else:
+                callback, arg = _set_result, result
+            try:
+                loop.call_soon_threadsafe(callback, future, arg)
+            except RuntimeError:
+                # The loop has closed, so nobody is waiting for the result
+                pass
+
+    async def _enqueue(self, func: Callable[[], Any]) -> Any:
+        """ Queue a call for the worker thread, and wait for its result.
+        :param func: Callable taking no arguments.
+        :return: The result of func.
+        """
+        if self._closed:
+            raise RuntimeError("AsyncSqlHelper is closed")
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._calls.put((loop, future, func))
+        return await future
+
+    async def run(self, func: Callable[[SqlHelper], Any]) -> Any:
+        """ Run a function against the wrapped helper on the worker thread.
+        Use this for anything needing the connection or a cursor, e.g.
+        ``await db.run(lambda h: h.con.commit())``
+
+        :param func: Callable taking the wrapped SqlHelper.
+        :return: The result of func.
+        """
+        return await self._enqueue(lambda: func(self._sync))
+
+    async def close(self) -> None:
+        """ Close the connection, if open, and stop the worker thread.
+        Calls made after this raise RuntimeError.
+        """
+        if self._closed:
+            return
+        # Refuse new calls, so nothing can be queued after _close or
+        # the sentinel. Calls already queued still run first.
+        self._closed = True
+
+        def _close():
+            # Give pooled connections back rather than closing them
+            release = getattr(self._sync, "release", None)
+            if release is not None:
+                release()
+            if self._sync._con:
+                self._sync._con.close()
+                self._sync._con = None
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._calls.put((loop, future, _close))
+        self._calls.put(None)
+        await future
+
+    async def row(self, sql: str, bind: Optional[Sequence] = None) -> Optional[dict]:
+        """ See :py:meth:`.SqlHelper.row` """
+        return await self._enqueue(lambda: self._sync.row(sql, bind))
+
+    async def t_row(self, sql: str, bind: Optional[Sequence] = None) -> Optional[tuple]:
+        """ See :py:meth:`.SqlHelper.t_row` """
+        return await self._enqueue(lambda: self._sync.t_row(sql, bind))
+
+    async def value(self, sql: str, bind: Optional[list] = None):
+        """ See :py:meth:`.SqlHelper.value` """
+        return await self._enqueue(lambda: self._sync.value(sql, bind))
+
+    async def rows(self, sql: str, bind: Optional[list] = None) -> Tuple[dict]:
+        """ See :py:meth:`.SqlHelper.rows` """
+        return await self._enqueue(lambda: self._sync.rows(sql, bind))
+
+    async def t_rows(self, sql: str, bind: Optional[list] = None) -> Tuple[tuple]:
+        """ See :py:meth:`.SqlHelper.t_rows` """
+        return await self._enqueue(lambda: self._sync.t_rows(sql, bind))
+
+    async def column(self, sql: str, bind: Optional[list] = None) -> List:
+        """ See :py:meth:`.SqlHelper.column` """
+        return await self._enqueue(lambda: self._sync.column(sql, bind))
+
+    async def insert(self, table: str, attributes: dict) -> None:
+        """ See :py:meth:`.SqlHelper.insert` """
+        await self._enqueue(lambda: self._sync.insert(table, attributes))
+
+    async def insert_many(self, table: str, rows: Sequence[dict]) -> None:
+        """ See :py:meth:`.SqlHelper.insert_many` """
+        await self._enqueue(lambda: self._sync.insert_many(table, rows))
+
+    async def update(self, table: str, attributes: dict, filters: dict) -> None:
+        """ See :py:meth:`.SqlHelper.update` """
+        await self._enqueue(lambda: self._sync.update(table, attributes, filters))
+
+
+def _set_result(future: asyncio.Future, result: Any) -> None:
+    """ Resolve the future, unless the waiter has given up on it """
+    if not future.done():
+        future.set_result(result)
+
+
+def _set_exception(future: asyncio.Future, e: BaseException) -> None:
+    """ Fail the future, unless the waiter has given up on it """
+    if not future.done():
+        future.set_exception(e)
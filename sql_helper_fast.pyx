@@ -0,0 +1,35 @@
+# cython: language_level=3
+#
+# Copyright (C) 2021 Steve Campbell
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+""" Optional compiled versions of sql_helper's per-row loops. Build in place
+with::
+
+    cythonize -i sql_helper_fast.pyx
+
+sql_helper uses these when the extension is importable.
+"""
+
+__author__ = "Steve Campbell"
+
+
+def dict_factory(cursor, tuple row):
+    """ Compiled :func:`sql_helper.sqlite_dict_factory` """
+    cdef tuple description = cursor.description
+    cdef dict d = {}
+    cdef Py_ssize_t idx
+    for idx in range(len(row)):
+        d[description[idx][0]] = row[idx]
+    return d
@@ -28,11 +28,14 @@ __author__ = "Steve Campbell"
 # * Update the db() fixture with an appropriate connection URL
 # * Run pytest as above
 
+import asyncio
 import pytest
 import re
 import sqlite3
+import time
 
 from sql_helper import SqlHelper, SqliteHelper
+from sql_helper_async import AsyncSqlHelper
 # from sql_helper_mysql import MysqlHelper
 
 
@@ -55,6 +58,18 @@ def test_connect(db):
     assert re.search("Connection", str(type(db.connect())))
 
 
+@pytest.mark.parametrize("url", ["sqlite://:memory:", "sqlite3://:memory:/"])
+def test_sqlite_url(url):
+    assert SqliteHelper(url=url).value("SELECT 1") == 1
+
+
+@pytest.mark.parametrize("tune, exp_mode", [(True, "wal"), (False, "delete")])
+def test_sqlite_tune(tmp_path, monkeypatch, tune, exp_mode):
+    monkeypatch.chdir(tmp_path)
+    db = SqliteHelper(url="sqlite://test.db", tune=tune)
+    assert db.value("PRAGMA journal_mode") == exp_mode
+
+
 def test_execute_returns_cursor(db):
     type_str = str(type(db.execute("SELECT 1")))
     assert re.search(r"(Cursor|MysqlHelper)", type_str)
@@ -71,6 +86,19 @@ def test_execute_returns_addressable_by_name(db):
     assert row["A"] == 1
 
 
+def test_execute_dicts_does_not_change_later_cursors(db):
+    db.execute("SELECT 1 AS A", fetch_dicts=True)
+    assert isinstance(db.execute("SELECT 1 AS A").fetchone(), tuple)
+
+
+def test_execute_sqlite_row_factory():
+    db = SqliteHelper(url="sqlite://:memory:/")
+    db.dict_row_factory = sqlite3.Row
+    row = db.execute("SELECT 1 AS A, 2 AS B", fetch_dicts=True).fetchone()
+    assert row["B"] == 2
+    assert dict(row) == {"A": 1, "B": 2}
+
+
 def test_execute_bind_with_question_mark(db):
     row = db.execute("SELECT ?", [2]).fetchone()
     assert row[0] == 2
@@ -81,6 +109,17 @@ def test_execute_bind_with_percent(db):
     assert row[0] == 2
 
 
+def test_execute_unix_timestamp(db):
+    row = db.execute("SELECT UNIX_TIMESTAMP()").fetchone()
+    assert row[0] > 1600000000
+
+
+def test_last_sql(db):
+    db.execute("SELECT ?, ?", [1, "a"])
+    assert db.last_sql() == "SQL: SELECT ?, ?, Bind: (1, a)"
+    assert str(db.lazy_last_sql()) == db.last_sql()
+
+
 def test_t_row_returns_none(db2):
     row = db2.t_row("SELECT Id,Value FROM Test WHERE Id=99")
     assert row is None
@@ -102,6 +141,21 @@ def test_t_row_returns_exception(db2):
         db2.t_row("SELECT * FROM Test")
 
 
+def test_t_row_limits_select(db2):
+    db2.t_row("SELECT Id FROM Test WHERE Id=1;")
+    assert "LIMIT 2" in db2.last_sql()
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT Id FROM Test WHERE Id=1 LIMIT 1",
+    "SELECT Id FROM Test WHERE Value='limit'",
+    "UPDATE Test SET Value='a' WHERE Id=99",
+])
+def test_t_row_leaves_sql(db2, sql):
+    db2.t_row(sql)
+    assert "LIMIT 2" not in db2.last_sql()
+
+
 def test_value(db2):
     assert db2.value("SELECT Value from Test where Id=?", [1]) == "a"
 
@@ -112,15 +166,110 @@ def test_rows(db2):
     )
 
 
+@pytest.mark.parametrize("size", [1, 2, 1000])
+def test_rows_iter(db2, size):
+    assert list(db2.rows_iter("SELECT * FROM Test", size=size)) == [
+        {"Id": 1, "Value": "a"}, {"Id": 2, "Value": "b"}
+    ]
+
+
+def test_t_rows(db2):
+    assert db2.t_rows("SELECT * FROM Test") == ((1, "a"), (2, "b"))
+
+
 def test_column(db2):
     assert db2.column("SELECT Value FROM Test") == ["a", "b"]
 
 
+@pytest.mark.parametrize("size", [1, 2, 1000])
+def test_column_iter(db2, size):
+    assert list(db2.column_iter("SELECT Value FROM Test", size=size)) == ["a", "b"]
+
+
 def test_insert(db2):
     db2.insert("Test", {"Id": 3, "Value": "c"})
     assert db2.value("SELECT COUNT(*) FROM Test") == 3
 
 
+def test_insert_repeated(db2):
+    db2.insert("Test", {"Id": 3, "Value": "c"})
+    db2.insert("Test", {"Id": 4, "Value": "d"})
+    assert db2.t_rows("SELECT * FROM Test WHERE Id > 2") == ((3, "c"), (4, "d"))
+
+
+def test_insert_many(db2):
+    db2.insert_many("Test", [{"Id": 3, "Value": "c"}, {"Value": "d", "Id": 4}])
+    assert db2.t_rows("SELECT * FROM Test WHERE Id > 2") == ((3, "c"), (4, "d"))
+
+
+def test_insert_many_columns(db):
+    fields = ["C%d" % i for i in range(130)]
+    db.execute("CREATE TABLE Wide(%s)" % ",".join("%s INTEGER" % f for f in fields))
+    db.insert("Wide", {f: i for i, f in enumerate(fields)})
+    assert db.t_row("SELECT C0, C129 FROM Wide") == (0, 129)
+
+
+def test_insert_many_baseline_subclass():
+    # A subclass written before executemany() existed
+    class OldSqliteHelper(SqlHelper):
+        def connect(self):
+            return sqlite3.connect(":memory:")
+
+        def execute(self, sql, bind=None, fetch_dicts=False):
+            bind = bind or []
+            super().execute(sql, bind)
+            cur = self.con.cursor()
+            cur.execute(sql, bind)
+            return cur
+
+    db = OldSqliteHelper()
+    db.execute("CREATE TABLE Test(Id INTEGER, Value TEXT)")
+    db.insert_many("Test", [{"Id": 1, "Value": "a"}, {"Id": 2, "Value": "b"}])
+    assert db.t_rows("SELECT * FROM Test") == ((1, "a"), (2, "b"))
+
+
+def test_insert_many_empty(db2):
+    db2.insert_many("Test", [])
+    assert db2.value("SELECT COUNT(*) FROM Test") == 2
+
+
+def test_transaction_commits(db2):
+    with db2.transaction():
+        db2.insert("Test", {"Id": 3, "Value": "c"})
+        with db2.transaction():
+            db2.insert("Test", {"Id": 4, "Value": "d"})
+    db2.con.rollback()
+    assert db2.value("SELECT COUNT(*) FROM Test") == 4
+
+
+def test_transaction_joins_caller_begin():
+    db = SqliteHelper(url="sqlite://:memory:")
+    db.execute("CREATE TABLE Test(Id INTEGER)")
+    db.execute("BEGIN")
+    with db.transaction():
+        db.insert("Test", {"Id": 1})
+    assert db.con.in_transaction
+    db.con.rollback()
+    assert db.value("SELECT COUNT(*) FROM Test") == 0
+
+
+def test_insert_single_row_autocommits():
+    db = SqliteHelper(url="sqlite://:memory:")
+    db.execute("CREATE TABLE Test(Id INTEGER)")
+    statements = []
+    db.con.set_trace_callback(statements.append)
+    db.insert("Test", {"Id": 1})
+    assert statements == ["INSERT INTO Test(`Id`) VALUES(1)"]
+
+
+def test_transaction_rolls_back(db2):
+    with pytest.raises(ValueError):
+        with db2.transaction():
+            db2.insert("Test", {"Id": 3, "Value": "c"})
+            raise ValueError("Oops")
+    assert db2.value("SELECT COUNT(*) FROM Test") == 2
+
+
 @pytest.mark.parametrize(
     "attributes, filters, exp_state, description", [
         ({"Value": "d"}, {}, (
@@ -141,8 +290,101 @@ def test_insert(db2):
         ({}, {}, (
                 {"Id": 1, "Value": "a"}, {"Id": 2, "Value": "b"}
         ), "Make an empty update"),
+        ({"Value": "d"}, {"Id": [1, 2]}, (
+                {"Id": 1, "Value": "d"}, {"Id": 2, "Value": "d"}
+        ), "Update filtering on a list"),
+        ({"Value": "d"}, {"Id": (2, 99), "Value": "b"}, (
+                {"Id": 1, "Value": "a"}, {"Id": 2, "Value": "d"}
+        ), "Update filtering on a tuple and a value"),
+        ({"Value": "d"}, {"Id": []}, (
+                {"Id": 1, "Value": "a"}, {"Id": 2, "Value": "b"}
+        ), "Update filtering on an empty list"),
     ]
 )
 def test_update(db2, attributes, filters, exp_state, description):
     db2.update("Test", attributes=attributes, filters=filters)
     assert db2.rows("SELECT * FROM Test") == exp_state
+
+
+def test_update_in_list_not_cached(db2):
+    for ids in ([1], [1, 2], [1, 2, 3]):
+        db2.update("Test", {"Value": "c"}, {"Id": ids})
+    db2.update("Test", {"Value": "d"}, {"Id": 1})
+    assert len(db2._update_sql_cache) == 1
+    assert db2.column("SELECT Value FROM Test ORDER BY Id") == ["d", "c"]
+
+
+def test_update_repeated(db2):
+    db2.update("Test", {"Value": "c"}, {"Id": 1})
+    db2.update("Test", {"Value": "d"}, {"Id": 2})
+    assert db2.column("SELECT Value FROM Test ORDER BY Id") == ["c", "d"]
+
+
+def _async_db2(adb):
+    # SQLite connections must be created and used on the worker thread
+    return adb.run(lambda h: h.execute(
+        "CREATE TABLE Test(Id INTEGER, Value TEXT)").execute(
+        "INSERT INTO Test(Id, Value) VALUES (1, 'a'), (2, 'b')"))
+
+
+def test_async():
+    async def run():
+        async with AsyncSqlHelper(SqliteHelper(url="sqlite://:memory:")) as adb:
+            await _async_db2(adb)
+            await adb.insert("Test", {"Id": 3, "Value": "c"})
+            return await adb.column("SELECT Value FROM Test"), await adb.row("SELECT * FROM Test WHERE Id=?", [3])
+
+    assert asyncio.run(run()) == (["a", "b", "c"], {"Id": 3, "Value": "c"})
+
+
+def test_async_raises():
+    async def run():
+        async with AsyncSqlHelper(SqliteHelper(url="sqlite://:memory:")) as adb:
+            await _async_db2(adb)
+            await adb.t_row("SELECT * FROM Test")
+
+    with pytest.raises(RuntimeError, match=r"Multiple rows"):
+        asyncio.run(run())
+
+
+def test_async_call_during_close():
+    helper = SqliteHelper(url="sqlite://:memory:")
+
+    async def run():
+        adb = AsyncSqlHelper(helper)
+        await adb.value("SELECT 1")
+        closing = asyncio.ensure_future(adb.close())
+        await asyncio.sleep(0)
+        with pytest.raises(RuntimeError, match=r"closed"):
+            await adb.value("SELECT 1")
+        await closing
+
+    asyncio.run(run())
+    assert helper._con is None
+
+
+def test_async_call_after_close():
+    async def run():
+        adb = AsyncSqlHelper(SqliteHelper(url="sqlite://:memory:"))
+        await adb.close()
+        with pytest.raises(RuntimeError, match=r"closed"):
+            await asyncio.wait_for(adb.value("SELECT 1"), timeout=1)
+
+    asyncio.run(run())
+
+
+def test_async_survives_closed_loop():
+    adb = AsyncSqlHelper(SqliteHelper(url="sqlite://:memory:"))
+
+    async def timeout():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(adb.run(lambda h: time.sleep(0.2)), timeout=0.01)
+
+    async def run():
+        value = await asyncio.wait_for(adb.value("SELECT 1"), timeout=5)
+        await adb.close()
+        return value
+
+    # The worker finishes the sleep after the first loop has closed
+    asyncio.run(timeout())
+    assert asyncio.run(run()) == 1